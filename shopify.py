@@ -1,27 +1,350 @@
 from typing import Any
+import asyncio
 import httpx
+import mmap
 import os
-import json
-import requests
-from typing import Dict, List, Optional, Union
+import logging
+import pathlib
+import orjson
+import random
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import cache, lru_cache, partial
+from types import MappingProxyType
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
 from typing_extensions import TypedDict
-from urllib.parse import urljoin, urlunparse
 from mcp.server.fastmcp import FastMCP
 from dotenv import load_dotenv
 import base64
 import mimetypes
 
-# Load environment variables
-load_dotenv()
+@asynccontextmanager
+async def _lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """
+    Close the event loop's HTTP client once the last server session ends. SSE enters
+    the lifespan once per connection, so sessions are counted rather than closing the
+    client as soon as any one of them ends.
+    """
+    global _active_sessions
+    _active_sessions += 1
+    try:
+        yield
+    finally:
+        _active_sessions -= 1
+        if not _active_sessions:
+            await _close_client()
+
+mcp = FastMCP("shopify", lifespan=_lifespan)
+
+@cache
+def _load_credentials() -> Tuple[str, str]:
+    """
+    Load the shop URL and access token from the environment (or .env file) on first use.
+    """
+    load_dotenv()
+    shop_url = os.getenv("SHOPIFY_SHOP_URL")
+    access_token = os.getenv("SHOPIFY_ACCESS_TOKEN")
+
+    if not shop_url or not access_token:
+        raise ValueError("SHOPIFY_SHOP_URL and SHOPIFY_ACCESS_TOKEN must be set in .env file")
+    return shop_url, access_token
+
+# Log to stderr; stdout carries the MCP stdio transport
+log = logging.getLogger(__name__)
+
+# Throttling (429) and transient gateway errors are retried with exponential backoff.
+# A gateway error can arrive after a mutation already ran, so mutations only retry 429
+_RETRY_STATUSES = (429, 502, 503, 504)
+_MUTATION_RETRY_STATUSES = (429,)
+_MAX_RETRIES = 5
+_BACKOFF_FACTOR = 0.5
+
+# REST Admin API leaky bucket: slow down before it fills up
+_CALL_LIMIT_THRESHOLD = 0.8
+_CALL_LIMIT_LEAK_RATE = 2.0
+
+def _call_limit_delay(headers) -> float:
+    """
+    Seconds to wait before the next call, based on X-Shopify-Shop-Api-Call-Limit ("used/total").
+    """
+    call_limit = headers.get("X-Shopify-Shop-Api-Call-Limit")
+    if not call_limit:
+        return 0.0
+    used, total = (int(n) for n in call_limit.split("/"))
+    if used / total <= _CALL_LIMIT_THRESHOLD:
+        return 0.0
+    return (used - total * 0.5) / _CALL_LIMIT_LEAK_RATE
+
+# GraphQL Admin API: a bucket of 1000 cost points restored at 50/s. The client-side
+# bucket mirrors it: each request reserves an estimated cost up front, and the actual
+# cost Shopify reports is charged once the response arrives. On top of that, requests
+# back off when the server-side bucket runs low, so concurrent fan-outs throttle
+# themselves instead of getting throttled
+_GRAPHQL_BUCKET_SIZE = 1000
+_GRAPHQL_RESTORE_RATE = 50
+_QUERY_COST_ESTIMATE = 1
+_MUTATION_COST_ESTIMATE = 10
+_THROTTLE_MIN_AVAILABLE = 0.1
+
+class _TokenBucket:
+    """
+    Async token bucket: allows bursts up to capacity, refilled at rate tokens per second.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.lock: Optional[asyncio.Lock] = None
+
+    def _lock(self) -> asyncio.Lock:
+        # asyncio locks bind to one event loop, so make a new one per loop
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop, self.lock = loop, asyncio.Lock()
+        return self.lock
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
 
-# Get credentials from environment variables
-SHOP_URL = os.getenv("SHOPIFY_SHOP_URL")
-ACCESS_TOKEN = os.getenv("SHOPIFY_ACCESS_TOKEN")
+    async def acquire(self, tokens: float = 1) -> None:
+        tokens = min(tokens, self.capacity)
+        async with self._lock():
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
 
-if not SHOP_URL or not ACCESS_TOKEN:
-    raise ValueError("SHOPIFY_SHOP_URL and SHOPIFY_ACCESS_TOKEN must be set in .env file")
+    def charge(self, tokens: float) -> None:
+        """
+        Take extra tokens (or return them, if negative) after the fact; the balance may go
+        negative, which delays later acquires until it is paid back.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - tokens)
 
-mcp = FastMCP("shopify")
+_GRAPHQL_LIMITER = _TokenBucket(_GRAPHQL_RESTORE_RATE, _GRAPHQL_BUCKET_SIZE)
+
+def _is_throttled(data: Dict) -> bool:
+    """
+    Whether Shopify rejected a GraphQL request for lack of cost points. This comes back
+    as HTTP 200 with a THROTTLED error, and the operation did not run.
+    """
+    return any(
+        error.get("extensions", {}).get("code") == "THROTTLED"
+        for error in data.get("errors", ())
+    )
+
+def _query_cost(data: Dict) -> Optional[float]:
+    """
+    Points Shopify charged for a GraphQL request (0 if it did not run), from extensions.cost.
+    """
+    try:
+        return data["extensions"]["cost"]["actualQueryCost"] or 0
+    except KeyError:
+        return None
+
+def _throttle_delay(data: Dict, throttled: bool = False) -> float:
+    """
+    Seconds to wait for the GraphQL cost bucket to refill, based on extensions.cost.throttleStatus.
+    A throttled request waits until its requested cost is available again.
+    """
+    try:
+        cost = data["extensions"]["cost"]
+        status = cost["throttleStatus"]
+    except KeyError:
+        return 0.0
+    floor = status["maximumAvailable"] * _THROTTLE_MIN_AVAILABLE
+    if throttled:
+        floor = max(floor, cost["requestedQueryCost"])
+    if status["currentlyAvailable"] >= floor:
+        return 0.0
+    return (floor - status["currentlyAvailable"]) / status["restoreRate"]
+
+# Shared HTTP/2 client: keeps connections alive across tool calls and multiplexes
+# concurrent requests over them. Failed connection attempts are retried by the
+# transport; throttled and 5xx responses are retried by _send_with_retry.
+# A client is bound to the event loop it first runs on, so there is one per loop,
+# created on first use: separate asyncio.run() calls each get a working client.
+_CONNECT_RETRIES = 3
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_active_sessions = 0
+
+def _client() -> httpx.AsyncClient:
+    """
+    The running event loop's HTTP client, created on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _clients[loop] = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=_CONNECT_RETRIES,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            ),
+            timeout=30.0
+        )
+    return client
+
+async def _close_client() -> None:
+    """
+    Close the running event loop's HTTP client, if it has one.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+@lru_cache(maxsize=32)
+def _headers(access_token: str) -> Mapping[str, str]:
+    """
+    Read-only per-token JSON request headers, cached so repeat calls reuse the same mapping.
+    """
+    return MappingProxyType({
+        "Content-Type": "application/json",
+        "X-Shopify-Access-Token": access_token
+    })
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """
+    Seconds to wait before retrying, preferring Shopify's Retry-After header.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return _BACKOFF_FACTOR * (2 ** attempt) + random.uniform(0, _BACKOFF_FACTOR)
+
+async def _send_with_retry(
+    method: str,
+    url: str,
+    retry_statuses: Tuple[int, ...] = _RETRY_STATUSES,
+    limiter: Optional[_TokenBucket] = None,
+    cost: float = 1,
+    **kwargs
+) -> httpx.Response:
+    """
+    Send a request with the shared client, retrying the given throttled and transient
+    statuses. Every attempt, retries included, takes cost tokens from limiter if given.
+    """
+    for attempt in range(_MAX_RETRIES + 1):
+        if limiter is not None:
+            await limiter.acquire(cost)
+        response = await _client().request(method, url, **kwargs)
+        if response.status_code not in retry_statuses or attempt == _MAX_RETRIES:
+            break
+        await asyncio.sleep(_retry_delay(response, attempt))
+
+    delay = _call_limit_delay(response.headers)
+    if delay:
+        await asyncio.sleep(delay)
+    return response
+
+def _admin_url(shop_url: str, path: str) -> str:
+    """
+    Absolute Admin API URL for a shop. Always HTTPS: a plain-HTTP request only gets
+    redirected, costing an extra round trip.
+    """
+    return f"https://{shop_url}{path}"
+
+def _pretty_json(value: Any) -> str:
+    """
+    Indented JSON for error messages.
+    """
+    return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode()
+
+@lru_cache(maxsize=None)
+def _query_prefix(query: str) -> bytes:
+    """
+    Encoded start of a GraphQL request body, up to the variables value.
+    The documents are module constants, so each one is encoded only once.
+    """
+    return b'{"query":' + orjson.dumps(query) + b',"variables":'
+
+def _graphql_body(query: str, variables: Dict) -> bytes:
+    """
+    JSON request body for a GraphQL document; only the variables are serialized per call.
+    """
+    return _query_prefix(query) + orjson.dumps(variables) + b"}"
+
+async def _execute(
+    shop_url: str,
+    access_token: str,
+    query: str,
+    variables: Dict
+) -> Dict:
+    """
+    Run a GraphQL operation against the Admin API and return its "data" object.
+
+    Raises:
+        httpx.HTTPError: If the API request fails
+        ValueError: If Shopify reports GraphQL or user errors for any root field
+    """
+    full_url = _admin_url(shop_url, _GRAPHQL_PATH)
+    log.debug("POST %s", full_url)
+
+    # Mutations are not idempotent; retrying one after a gateway error could repeat it
+    if query.startswith("mutation"):
+        retry_statuses, estimate = _MUTATION_RETRY_STATUSES, _MUTATION_COST_ESTIMATE
+    else:
+        retry_statuses, estimate = _RETRY_STATUSES, _QUERY_COST_ESTIMATE
+    body = _graphql_body(query, variables)
+
+    # A THROTTLED response means the operation did not run, so it is safe to resend
+    for attempt in range(_MAX_RETRIES + 1):
+        try:
+            response = await _send_with_retry(
+                "POST",
+                full_url,
+                retry_statuses=retry_statuses,
+                limiter=_GRAPHQL_LIMITER,
+                cost=estimate,
+                content=body,
+                headers=_headers(access_token)
+            )
+            response.raise_for_status()
+        except httpx.HTTPError:
+            log.exception("Shopify request failed")
+            raise
+
+        data = orjson.loads(response.content)
+        cost = _query_cost(data)
+        if cost is not None:
+            _GRAPHQL_LIMITER.charge(cost - estimate)
+        throttled = _is_throttled(data)
+        delay = _throttle_delay(data, throttled)
+        if throttled and attempt < _MAX_RETRIES:
+            await asyncio.sleep(delay or _BACKOFF_FACTOR * (2 ** attempt))
+            continue
+        # Still throttled after the last attempt: fail now rather than wait for nothing
+        if delay and not throttled:
+            await asyncio.sleep(delay)
+        break
+
+    if "errors" in data:
+        raise ValueError(f"GraphQL errors: {_pretty_json(data['errors'])}")
+
+    try:
+        result = data["data"]
+    except KeyError:
+        raise ValueError(f"Malformed response: {_pretty_json(data)}")
+    for field, payload in result.items():
+        if not payload:
+            continue
+        user_errors = payload.get("userErrors") or payload.get("mediaUserErrors")
+        if user_errors:
+            raise ValueError(f"{field} user errors: {_pretty_json(user_errors)}")
+    return result
 
 class ProductOption(TypedDict):
     name: str
@@ -61,7 +384,160 @@ class ProductMedia(TypedDict):
     src: str
     alt: Optional[str]
 
-def create_shopify_product(
+# Admin API endpoints, shared by every call so they all target the same version
+_API_VERSION = "2024-01"
+_GRAPHQL_PATH = f"/admin/api/{_API_VERSION}/graphql.json"
+_THEME_ASSETS_PATH = f"/admin/api/{_API_VERSION}/themes/{{}}/assets.json"
+
+# Media and metafields sent inline with productCreate; the rest is attached by
+# follow-up requests once the product exists
+_MEDIA_BATCH_SIZE = 10
+_METAFIELDS_BATCH_SIZE = 25
+_MAX_CONCURRENT_FOLLOW_UPS = 4
+
+def _compact_query(query: str) -> str:
+    """
+    Collapse insignificant whitespace in a GraphQL document to shrink request bodies.
+    The documents below contain no string literals, so this is lossless.
+    """
+    return " ".join(query.split())
+
+# GraphQL documents are constant, so build them once at import time
+_PRODUCT_CREATE_MUTATION = _compact_query("""
+mutation productCreate($input: ProductInput!, $media: [CreateMediaInput!]) {
+    productCreate(input: $input, media: $media) {
+        product {
+            id
+            handle
+        }
+        userErrors {
+            field
+            message
+        }
+    }
+}
+""")
+
+_MEDIA_MUTATION = _compact_query("""
+mutation productCreateMedia($productId: ID!, $media: [CreateMediaInput!]!) {
+    productCreateMedia(productId: $productId, media: $media) {
+        mediaUserErrors {
+            field
+            message
+        }
+    }
+}
+""")
+
+_METAFIELDS_MUTATION = _compact_query("""
+mutation metafieldsSet($metafields: [MetafieldsSetInput!]!) {
+    metafieldsSet(metafields: $metafields) {
+        userErrors {
+            field
+            message
+        }
+    }
+}
+""")
+
+_PRODUCT_QUERY = _compact_query("""
+query product($id: ID!) {
+    product(id: $id) {
+        id
+        title
+        handle
+        description
+        descriptionHtml
+        productType
+        vendor
+        status
+        tags
+        options {
+            id
+            name
+            values
+        }
+        variants(first: 100) {
+            edges {
+                node {
+                    id
+                    title
+                    sku
+                    price
+                    inventoryQuantity
+                }
+            }
+        }
+        media(first: 100) {
+            edges {
+                node {
+                    id
+                    mediaContentType
+                    alt
+                    ... on MediaImage {
+                        image {
+                            originalSrc
+                        }
+                    }
+                }
+            }
+        }
+        seo {
+            title
+            description
+        }
+        metafields(first: 100) {
+            edges {
+                node {
+                    id
+                    namespace
+                    key
+                    value
+                    type
+                }
+            }
+        }
+    }
+}
+""")
+
+_STAGED_UPLOADS_MUTATION = _compact_query("""
+mutation stagedUploadsCreate($input: [StagedUploadInput!]!) {
+  stagedUploadsCreate(input: $input) {
+    stagedTargets {
+      url
+      resourceUrl
+      parameters {
+        name
+        value
+      }
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+""")
+
+_FILE_CREATE_MUTATION = _compact_query("""
+mutation fileCreate($files: [FileCreateInput!]!) {
+  fileCreate(files: $files) {
+    files {
+      id
+      fileStatus
+      alt
+      createdAt
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+""")
+
+async def create_shopify_product(
     shop_url: str,
     access_token: str,
     title: str,
@@ -103,330 +579,343 @@ def create_shopify_product(
         metafields: List of metafields to attach to the product
     
     Returns:
-        Dict: The created product data from Shopify
+        Dict: The created product's ID and handle from Shopify
     
     Raises:
-        requests.exceptions.RequestException: If the API request fails
+        httpx.HTTPError: If the API request fails
         ValueError: If required parameters are missing or invalid
     """
     if not all([shop_url, access_token, title]):
         raise ValueError("shop_url, access_token, and title are required parameters")
 
-    # Prepare the GraphQL mutation
-    mutation = """
-    mutation productCreate($input: ProductInput!) {
-        productCreate(input: $input) {
-            product {
-                id
-                title
-                handle
-                description
-                descriptionHtml
-                productType
-                vendor
-                status
-                tags
-                options {
-                    id
-                    name
-                    values
-                }
-                variants(first: 100) {
-                    edges {
-                        node {
-                            id
-                            title
-                            sku
-                            price
-                            inventoryQuantity
-                        }
-                    }
-                }
-                media(first: 100) {
-                    edges {
-                        node {
-                            id
-                            mediaContentType
-                            alt
-                            ... on MediaImage {
-                                image {
-                                    originalSrc
-                                }
-                            }
-                        }
-                    }
-                }
-                seo {
-                    title
-                    description
-                }
-                metafields(first: 100) {
-                    edges {
-                        node {
-                            id
-                            namespace
-                            key
-                            value
-                            type
-                        }
-                    }
-                }
-            }
-            userErrors {
-                field
-                message
-            }
-        }
-    }
-    """
+    media = media or []
+    metafields = metafields or []
 
     # Prepare the variables for the mutation
-    variables = {
-        "input": {
-            "title": title,
-            "status": status,
-            "giftCard": gift_card,
-            "requiresSellingPlan": requires_selling_plan
-        }
-    }
-
-    # Add optional fields if provided
-    if description_html:
-        variables["input"]["descriptionHtml"] = description_html
-    if product_type:
-        variables["input"]["productType"] = product_type
-    if vendor:
-        variables["input"]["vendor"] = vendor
-    if handle:
-        variables["input"]["handle"] = handle
-    if tags:
-        variables["input"]["tags"] = tags
-    if seo:
-        variables["input"]["seo"] = seo
-    if product_options:
-        variables["input"]["options"] = product_options
-    if variants:
-        variables["input"]["variants"] = variants
-    if collections:
-        variables["input"]["collectionsToJoin"] = collections
-
-    # Prepare the request headers
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": access_token
+    product_input = {
+        "title": title,
+        "status": status,
+        "giftCard": gift_card,
+        "requiresSellingPlan": requires_selling_plan
     }
-
-    # Construct URL properly
-    full_url = f"https://{shop_url}/admin/api/2024-01/graphql.json"
-    print(f"Making request to: {full_url}")
-    
-    try:
-        response = requests.post(
-            full_url,
-            json={"query": mutation, "variables": variables},
-            headers=headers,
-            verify=True
+    # Optional fields are only sent when provided
+    product_input.update(
+        (key, value)
+        for key, value in (
+            ("descriptionHtml", description_html),
+            ("productType", product_type),
+            ("vendor", vendor),
+            ("handle", handle),
+            ("tags", tags),
+            ("seo", seo),
+            ("options", product_options),
+            ("variants", variants),
+            ("collectionsToJoin", collections)
         )
-    except Exception as e:
-        print(f"Request failed: {str(e)}")
-        raise
+        if value
+    )
+    if metafields:
+        product_input["metafields"] = _inline_metafields_input(metafields[:_METAFIELDS_BATCH_SIZE])
+    variables = {"input": product_input}
 
-    # Check for request errors
-    response.raise_for_status()
-    
-    data = response.json()
-    
-    # Check for GraphQL errors
-    if "errors" in data:
-        raise ValueError(f"GraphQL errors: {json.dumps(data['errors'], indent=2)}")
-    
-    # Check for user errors
-    user_errors = data.get("data", {}).get("productCreate", {}).get("userErrors", [])
-    if user_errors:
-        raise ValueError(f"User errors: {json.dumps(user_errors, indent=2)}")
+    # The first batch of media is created together with the product in the same request
+    if media:
+        variables["media"] = _media_input(media[:_MEDIA_BATCH_SIZE])
+
+    result = await _execute(shop_url, access_token, _PRODUCT_CREATE_MUTATION, variables)
 
     # Get the created product
-    product = data.get("data", {}).get("productCreate", {}).get("product")
+    product = result["productCreate"]["product"]
     if not product:
         raise ValueError("Product creation failed: No product data returned")
 
-    # If media is provided, attach it to the product
-    if media and product.get("id"):
-        _attach_media(shop_url, access_token, product["id"], media)
-
-    # If metafields are provided, create them
-    if metafields and product.get("id"):
-        _create_metafields(shop_url, access_token, product["id"], metafields)
+    # Media and metafields that did not fit inline go out in per-request batches. The
+    # batches are independent of each other, so attach them concurrently (bounded) and
+    # let each fail on its own
+    semaphore = asyncio.Semaphore(_MAX_CONCURRENT_FOLLOW_UPS)
+    follow_ups = [
+        _bounded(semaphore, partial(_attach_media, shop_url, access_token, product["id"], batch))
+        for batch in _batches(media[_MEDIA_BATCH_SIZE:], _MEDIA_BATCH_SIZE)
+    ] + [
+        _bounded(semaphore, partial(_create_metafields, shop_url, access_token, product["id"], batch))
+        for batch in _batches(metafields[_METAFIELDS_BATCH_SIZE:], _METAFIELDS_BATCH_SIZE)
+    ]
+    results = await asyncio.gather(*follow_ups, return_exceptions=True)
+    errors = [str(r) for r in results if isinstance(r, Exception)]
+    if errors:
+        raise ValueError(f"Product {product['id']} created, but follow-up requests failed: {'; '.join(errors)}")
 
     return product
 
-def _attach_media(
+def _batches(items: List, size: int) -> List[List]:
+    """
+    Split items into consecutive lists of at most size elements.
+    """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+async def _bounded(semaphore: asyncio.Semaphore, make: Callable[[], Awaitable]) -> Any:
+    """
+    Call make and await its result while holding semaphore. The coroutine is only
+    created once a slot is free, so cancelling a queued call leaves nothing un-awaited.
+    """
+    async with semaphore:
+        return await make()
+
+async def _gather_or_cancel(*aws: Awaitable) -> List:
+    """
+    Like asyncio.gather, but cancels the remaining awaitables as soon as one fails.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+def _media_input(media: List[ProductMedia]) -> List[Dict]:
+    """
+    Build the CreateMediaInput list for the given media items.
+    """
+    return [
+        {"originalSource": src, "mediaContentType": media_type, "alt": alt}
+        for src, media_type, alt in ((m["src"], m["type"], m.get("alt", "")) for m in media)
+    ]
+
+def _inline_metafields_input(metafields: List[Metafield]) -> List[Dict]:
+    """
+    Build the MetafieldInput list for metafields created together with the product.
+    """
+    return [
+        {
+            "namespace": m["namespace"],
+            "key": m["key"],
+            "value": m["value"],
+            "type": m["type"]
+        }
+        for m in metafields
+    ]
+
+def _metafields_input(product_id: str, metafields: List[Metafield]) -> List[Dict]:
+    """
+    Build the MetafieldsSetInput list for the given product metafields.
+    """
+    return [
+        {
+            "ownerId": product_id,
+            "namespace": m["namespace"],
+            "key": m["key"],
+            "value": m["value"],
+            "type": m["type"]
+        }
+        for m in metafields
+    ]
+
+async def _attach_media(
     shop_url: str,
     access_token: str,
     product_id: str,
     media: List[ProductMedia]
 ) -> None:
     """
-    Attach media to a product using the Admin API.
-    """
-    mutation = """
-    mutation productCreateMedia($productId: ID!, $media: [CreateMediaInput!]!) {
-        productCreateMedia(productId: $productId, media: $media) {
-            media {
-                id
-                mediaContentType
-                alt
-            }
-            mediaUserErrors {
-                field
-                message
-            }
-        }
-    }
+    Attach media to an existing product using the Admin API.
     """
-
     variables = {
         "productId": product_id,
-        "media": [
-            {
-                "originalSource": m["src"],
-                "mediaContentType": m["type"],
-                "alt": m.get("alt", "")
-            }
-            for m in media
-        ]
-    }
-
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": access_token
+        "media": _media_input(media)
     }
+    try:
+        await _execute(shop_url, access_token, _MEDIA_MUTATION, variables)
+    finally:
+        _product_cache.pop((shop_url, access_token, product_id), None)
 
-    full_url = f"http://{shop_url}/admin/api/2024-01/graphql.json"
-    response = requests.post(
-        full_url,
-        json={"query": mutation, "variables": variables},
-        headers=headers
-    )
-
-    response.raise_for_status()
-    
-    data = response.json()
-    
-    if "errors" in data:
-        raise ValueError(f"Media attachment errors: {json.dumps(data['errors'], indent=2)}")
-
-    media_errors = data.get("data", {}).get("productCreateMedia", {}).get("mediaUserErrors", [])
-    if media_errors:
-        raise ValueError(f"Media user errors: {json.dumps(media_errors, indent=2)}")
-
-def _create_metafields(
+async def _create_metafields(
     shop_url: str,
     access_token: str,
     product_id: str,
     metafields: List[Metafield]
 ) -> None:
     """
-    Create metafields for a product using the Admin API.
-    """
-    mutation = """
-    mutation metafieldsSet($metafields: [MetafieldsSetInput!]!) {
-        metafieldsSet(metafields: $metafields) {
-            metafields {
-                id
-                namespace
-                key
-                value
-                type
-            }
-            userErrors {
-                field
-                message
-            }
-        }
-    }
+    Create metafields for an existing product using the Admin API.
     """
-
     variables = {
-        "metafields": [
-            {
-                "ownerId": product_id,
-                "namespace": m["namespace"],
-                "key": m["key"],
-                "value": m["value"],
-                "type": m["type"]
-            }
-            for m in metafields
-        ]
+        "metafields": _metafields_input(product_id, metafields)
     }
+    try:
+        await _execute(shop_url, access_token, _METAFIELDS_MUTATION, variables)
+    finally:
+        _product_cache.pop((shop_url, access_token, product_id), None)
+
+# Full product reads keyed by (shop_url, access_token, product_id), least recently used
+# first. The token is part of the key so a read is never served to a caller whose own
+# token Shopify would refuse.
+# Mutations on a product drop its entry; changes made elsewhere (the Shopify admin,
+# other apps) are picked up once the entry expires. Entries hold the serialized
+# product, so every hit returns a fresh copy callers can modify.
+_PRODUCT_CACHE_SIZE = 1024
+_PRODUCT_CACHE_TTL = 30.0
+_product_cache: "OrderedDict[Tuple[str, str, str], Tuple[float, bytes]]" = OrderedDict()
+
+async def get_shopify_product(shop_url: str, access_token: str, product_id: str) -> Dict:
+    """
+    Fetch a product with its options, variants, media, SEO and metafields.
+
+    Repeat reads of the same product within _PRODUCT_CACHE_TTL seconds are served from
+    an in-memory LRU cache.
+
+    Args:
+        shop_url: Your Shopify shop URL (e.g., "your-shop.myshopify.com")
+        access_token: Your Shopify Admin API access token
+        product_id: The product's GraphQL ID (e.g., "gid://shopify/Product/123")
+
+    Returns:
+        Dict: The product data from Shopify
+
+    Raises:
+        httpx.HTTPError: If the API request fails
+        ValueError: If the product does not exist
+    """
+    key = (shop_url, access_token, product_id)
+    entry = _product_cache.get(key)
+    if entry is not None:
+        expires_at, cached = entry
+        if time.monotonic() < expires_at:
+            _product_cache.move_to_end(key)
+            return orjson.loads(cached)
+        del _product_cache[key]
+
+    result = await _execute(shop_url, access_token, _PRODUCT_QUERY, {"id": product_id})
+    product = result["product"]
+    if not product:
+        raise ValueError(f"Product not found: {product_id}")
 
+    _product_cache[key] = (time.monotonic() + _PRODUCT_CACHE_TTL, orjson.dumps(product))
+    if len(_product_cache) > _PRODUCT_CACHE_SIZE:
+        _product_cache.popitem(last=False)
+    return product
+
+# Load the MIME database up front instead of on the first upload
+mimetypes.init()
+
+def _mime_type(filename: str) -> str:
+    """
+    MIME type for a file name, cached per full suffix (e.g., ".tar.gz") so that
+    multi-suffix names resolve as mimetypes.guess_type would resolve the name itself.
+    """
+    return _mime_type_for_suffixes("".join(pathlib.PurePath(filename).suffixes))
+
+@lru_cache(maxsize=256)
+def _mime_type_for_suffixes(suffixes: str) -> str:
+    mime_type, _ = mimetypes.guess_type(f"file{suffixes}")
+    return mime_type or "application/octet-stream"
+
+# Read size for streamed file uploads
+_UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# HTML5 form-data escaping for quoted Content-Disposition parameters, as httpx does:
+# backslash and quote are escaped, C0 controls (except ESC) percent-encoded, so a name
+# containing CR/LF cannot inject header lines
+_FORM_PARAM_ESCAPES = str.maketrans({
+    '"': "%22",
+    "\\": "\\\\",
+    **{chr(c): f"%{c:02X}" for c in range(0x20) if c != 0x1B}
+})
+
+def _form_param(value: str) -> str:
+    """
+    Escape a value for a quoted multipart Content-Disposition parameter.
+    """
+    return value.translate(_FORM_PARAM_ESCAPES)
+
+def _multipart_upload(
+    params: Dict[str, str],
+    filename: str,
+    file_path: str,
+    mime_type: str
+) -> Tuple[Dict[str, str], AsyncIterator[bytes]]:
+    """
+    Build headers and a streaming multipart/form-data body for a staged upload.
+
+    The form fields come first and the file last, as staged upload targets require. The
+    file is read one chunk ahead on a worker thread, so disk reads overlap with the
+    upload and at most two chunks are held in memory.
+    """
+    boundary = os.urandom(16).hex()
+    head = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{_form_param(name)}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in params.items()
+    ) + (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{_form_param(filename)}"\r\n'
+        f"Content-Type: {mime_type}\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
     headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": access_token
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(head) + os.path.getsize(file_path) + len(tail))
     }
 
-    full_url = f"https://{shop_url}/admin/api/2024-01/graphql.json"
-    response = requests.post(
-        full_url,
-        json={"query": mutation, "variables": variables},
-        headers=headers
-    )
+    async def body() -> AsyncIterator[bytes]:
+        yield head
+        with open(file_path, "rb") as file:
+            # Read the next chunk while the current one is being sent
+            pending = asyncio.ensure_future(asyncio.to_thread(file.read, _UPLOAD_CHUNK_SIZE))
+            try:
+                while chunk := await pending:
+                    pending = asyncio.ensure_future(asyncio.to_thread(file.read, _UPLOAD_CHUNK_SIZE))
+                    yield chunk
+            finally:
+                # Let an in-flight read finish before the file is closed
+                await asyncio.gather(pending, return_exceptions=True)
+        yield tail
 
-    response.raise_for_status()
-    
-    data = response.json()
-    
-    if "errors" in data:
-        raise ValueError(f"Metafield creation errors: {json.dumps(data['errors'], indent=2)}")
+    return headers, body()
 
-    metafield_errors = data.get("data", {}).get("metafieldsSet", {}).get("userErrors", [])
-    if metafield_errors:
-        raise ValueError(f"Metafield user errors: {json.dumps(metafield_errors, indent=2)}")
-    
-def upload_file_to_shopify(file_path: str, alt: str = None) -> dict:
+# Staged uploads sent to storage at the same time. Sending a large body can take
+# arbitrarily long, so only the write timeout is lifted for them
+_MAX_CONCURRENT_UPLOADS = 4
+_UPLOAD_TIMEOUT = httpx.Timeout(30.0, write=None)
+
+async def _upload_to_staged_target(staged: Dict, file_path: str, filename: str, mime_type: str) -> None:
     """
-    Uploads a file to the Shopify store's Files section using the GraphQL Admin API.
+    Upload a file to the staged URL returned by stagedUploadsCreate.
+    """
+    params = {p["name"]: p["value"] for p in staged["parameters"]}
+    headers, body = _multipart_upload(params, filename, file_path, mime_type)
+    response = await _client().post(staged["url"], content=body, headers=headers, timeout=_UPLOAD_TIMEOUT)
+    if response.status_code not in (200, 201, 204):
+        raise Exception(f"Failed to upload file to staged URL: {response.text}")
+
+async def upload_files_to_shopify(file_paths: List[str], alts: Optional[List[Optional[str]]] = None) -> dict:
+    """
+    Uploads files to the Shopify store's Files section using the GraphQL Admin API.
+
+    All files share one stagedUploadsCreate and one fileCreate request; the uploads to
+    the staged URLs run concurrently.
     Args:
-        file_path (str): Local path to the file.
-        alt (str, optional): Alt text for the file.
+        file_paths (List[str]): Local paths to the files.
+        alts (List[Optional[str]], optional): Alt text per file, in the same order.
     Returns:
         dict: The fileCreate mutation response from Shopify.
     """
-    filename = os.path.basename(file_path)
-    mime_type, _ = mimetypes.guess_type(file_path)
-    if not mime_type:
-        mime_type = "application/octet-stream"
-    is_image = mime_type.startswith("image/")
-    resource_type = "IMAGE" if is_image else "FILE"
-    content_type = "IMAGE" if is_image else "FILE"
-
-    # Debug output
-    print(f"[DEBUG] file_path: {file_path}")
-    print(f"[DEBUG] filename: {filename}")
-    print(f"[DEBUG] mime_type: {mime_type}")
-    print(f"[DEBUG] is_image: {is_image}")
-    print(f"[DEBUG] resource_type: {resource_type}")
-    print(f"[DEBUG] content_type: {content_type}")
-
-    # Step 1: Get staged upload parameters
-    mutation = """
-    mutation stagedUploadsCreate($input: [StagedUploadInput!]!) {
-      stagedUploadsCreate(input: $input) {
-        stagedTargets {
-          url
-          resourceUrl
-          parameters {
-            name
-            value
-          }
-        }
-        userErrors {
-          field
-          message
-        }
-      }
-    }
-    """
+    alts = alts or [None] * len(file_paths)
+    if len(alts) != len(file_paths):
+        raise ValueError("alts must have one entry per file path")
+    if not file_paths:
+        return {"data": {"fileCreate": {"files": [], "userErrors": []}}}
+
+    files = []
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
+        mime_type = _mime_type(filename)
+        resource_type = "IMAGE" if mime_type.startswith("image/") else "FILE"
+        log.debug(
+            "Uploading file_path=%s filename=%s mime_type=%s resource_type=%s",
+            file_path, filename, mime_type, resource_type
+        )
+        files.append((file_path, filename, mime_type, resource_type))
+
+    # Step 1: Get staged upload parameters for every file at once
     variables = {
         "input": [
             {
@@ -435,62 +924,66 @@ def upload_file_to_shopify(file_path: str, alt: str = None) -> dict:
                 "mimeType": mime_type,
                 "httpMethod": "POST"
             }
+            for _, filename, mime_type, resource_type in files
         ]
     }
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": ACCESS_TOKEN
-    }
-    graphql_url = f"https://{SHOP_URL}/admin/api/2023-10/graphql.json"
-    resp = requests.post(graphql_url, json={"query": mutation, "variables": variables}, headers=headers)
-    resp.raise_for_status()
-    data = resp.json()
-    print(f"[DEBUG] stagedUploadsCreate response: {json.dumps(data, indent=2)}")
-    errors = data.get("data", {}).get("stagedUploadsCreate", {}).get("userErrors", [])
-    if errors:
-        raise Exception(f"Shopify stagedUploadsCreate error: {errors}")
-    staged = data["data"]["stagedUploadsCreate"]["stagedTargets"][0]
-    upload_url = staged["url"]
-    resource_url = staged["resourceUrl"]
-    params = {p["name"]: p["value"] for p in staged["parameters"]}
+    shop_url, access_token = _load_credentials()
+    result = await _execute(shop_url, access_token, _STAGED_UPLOADS_MUTATION, variables)
+    staged_targets = result["stagedUploadsCreate"]["stagedTargets"]
+    if len(staged_targets) != len(files):
+        raise ValueError(
+            f"stagedUploadsCreate returned {len(staged_targets)} targets for {len(files)} files"
+        )
+    log.debug("Staged upload targets resource_urls=%s", [t["resourceUrl"] for t in staged_targets])
 
-    # Step 2: Upload the file to the staged URL (S3)
-    with open(file_path, "rb") as f:
-        files = {"file": (filename, f, mime_type)}
-        response = requests.post(upload_url, data=params, files=files)
-    if response.status_code not in (200, 201, 204):
-        raise Exception(f"Failed to upload file to staged URL: {response.text}")
+    # Step 2: Upload the files to their staged URLs (S3) concurrently; stop them all
+    # if one fails
+    semaphore = asyncio.Semaphore(_MAX_CONCURRENT_UPLOADS)
+    await _gather_or_cancel(*(
+        _bounded(semaphore, partial(_upload_to_staged_target, staged, file_path, filename, mime_type))
+        for staged, (file_path, filename, mime_type, _) in zip(staged_targets, files)
+    ))
 
-    # Step 3: Register the file in Shopify using fileCreate
-    mutation = """
-    mutation fileCreate($files: [FileCreateInput!]!) {
-      fileCreate(files: $files) {
-        files {
-          id
-          fileStatus
-          alt
-          createdAt
+    # Step 3: Register all files in Shopify with one fileCreate
+    file_inputs = []
+    for staged, (_, filename, _, resource_type), alt in zip(staged_targets, files, alts):
+        file_input = {
+            "originalSource": staged["resourceUrl"],
+            "contentType": resource_type,
+            "filename": filename
         }
-        userErrors {
-          field
-          message
-        }
-      }
-    }
+        if alt:
+            file_input["alt"] = alt
+        file_inputs.append(file_input)
+    variables = {"files": file_inputs}
+    result = await _execute(shop_url, access_token, _FILE_CREATE_MUTATION, variables)
+    return {"data": result}
+
+async def upload_file_to_shopify(file_path: str, alt: str = None) -> dict:
     """
-    file_input = {
-        "originalSource": resource_url,
-        "contentType": content_type,
-        "filename": filename
-    }
-    if alt:
-        file_input["alt"] = alt
-    variables = {"files": [file_input]}
-    resp = requests.post(graphql_url, json={"query": mutation, "variables": variables}, headers=headers)
-    resp.raise_for_status()
-    return resp.json()
+    Uploads a file to the Shopify store's Files section using the GraphQL Admin API.
+    Args:
+        file_path (str): Local path to the file.
+        alt (str, optional): Alt text for the file.
+    Returns:
+        dict: The fileCreate mutation response from Shopify.
+    """
+    return await upload_files_to_shopify([file_path], [alt])
 
-def upload_theme_asset(theme_id: str, asset_key: str, file_path: str) -> dict:
+def _encode_file_b64(file_path: str) -> str:
+    """
+    Base64-encode a file through a read-only memory map, so its raw contents are never
+    copied into a bytes object. The output alphabet is ASCII, so the final decode skips
+    UTF-8 validation.
+    """
+    with open(file_path, "rb") as file:
+        # Zero-length files cannot be mapped
+        if os.fstat(file.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return base64.b64encode(mapped).decode("ascii")
+
+async def upload_theme_asset(theme_id: str, asset_key: str, file_path: str) -> dict:
     """
     Upload a file as a theme asset to Shopify using the REST Admin API.
 
@@ -502,26 +995,23 @@ def upload_theme_asset(theme_id: str, asset_key: str, file_path: str) -> dict:
     Returns:
         dict: The JSON response from Shopify.
     """
-    with open(file_path, "rb") as file:
-        encoded_string = base64.b64encode(file.read()).decode("utf-8")
+    # Encoding is CPU and disk bound, so keep it off the event loop
+    encoded_string = await asyncio.to_thread(_encode_file_b64, file_path)
 
-    url = f"https://{SHOP_URL}/admin/api/2023-10/themes/{theme_id}/assets.json"
-    headers = {
-        "X-Shopify-Access-Token": ACCESS_TOKEN,
-        "Content-Type": "application/json"
-    }
+    shop_url, access_token = _load_credentials()
+    url = _admin_url(shop_url, _THEME_ASSETS_PATH.format(theme_id))
     data = {
         "asset": {
             "key": asset_key,
             "attachment": encoded_string
         }
     }
-    response = requests.put(url, json=data, headers=headers)
+    response = await _send_with_retry("PUT", url, content=orjson.dumps(data), headers=_headers(access_token))
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
 
 @mcp.tool()
-def create_product(    
+async def create_product(    
     title: str,
     descriptionHtml: Optional[str] = None,
     productType: Optional[str] = None,
@@ -534,11 +1024,11 @@ def create_product(
     requiresSellingPlan: bool = False,
     collectionsToJoin: Optional[List[str]] = None,
     metafields: Optional[List[Dict[str, str]]] = None) -> str:
-    debug_info = []
-    try:        
-        result = create_shopify_product(
-            shop_url=SHOP_URL,
-            access_token=ACCESS_TOKEN,
+    try:
+        shop_url, access_token = _load_credentials()
+        result = await create_shopify_product(
+            shop_url=shop_url,
+            access_token=access_token,
             title=title,
             description_html=descriptionHtml,
             product_type=productType,
@@ -552,16 +1042,28 @@ def create_product(
             collections=collectionsToJoin,
             metafields=metafields
         )
-        debug_info.append("Product creation successful")
-        debug_info.append(f"Response: {json.dumps(result, indent=2)}")
-        return "\n".join(debug_info)
+        return f"Product creation successful\nResponse: {orjson.dumps(result).decode()}"
     except Exception as e:
-        error_msg = f"Error creating product: {str(e)}"
-        debug_info.append(error_msg)
-        return "\n".join(debug_info)
+        return f"Error creating product: {str(e)}"
     
 @mcp.tool()
-def upload_theme_asset_tool(theme_id: str, asset_key: str, file_path: str) -> str:
+async def get_product(productId: str) -> str:
+    """
+    MCP tool: Fetch a product with its options, variants, media, SEO and metafields.
+    Args:
+        productId (str): The product's GraphQL ID (e.g., 'gid://shopify/Product/123').
+    Returns:
+        str: The product data from Shopify as a JSON string.
+    """
+    try:
+        shop_url, access_token = _load_credentials()
+        result = await get_shopify_product(shop_url, access_token, productId)
+        return orjson.dumps(result).decode()
+    except Exception as e:
+        return f"Error fetching product: {str(e)}"
+
+@mcp.tool()
+async def upload_theme_asset_tool(theme_id: str, asset_key: str, file_path: str) -> str:
     """
     MCP tool: Upload a file as a theme asset to Shopify using the REST Admin API.
     Args:
@@ -572,13 +1074,13 @@ def upload_theme_asset_tool(theme_id: str, asset_key: str, file_path: str) -> st
         str: The JSON response from Shopify as a string.
     """
     try:
-        result = upload_theme_asset(theme_id, asset_key, file_path)
-        return json.dumps(result)
+        result = await upload_theme_asset(theme_id, asset_key, file_path)
+        return orjson.dumps(result).decode()
     except Exception as e:
         return f"Error uploading theme asset: {str(e)}"
     
 @mcp.tool()
-def upload_file_to_shopify_tool(file_path: str, alt: str = None) -> str:
+async def upload_file_to_shopify_tool(file_path: str, alt: str = None) -> str:
     """
     MCP tool: Upload a file to the Shopify store's Files section using the GraphQL Admin API.
     Args:
@@ -588,10 +1090,27 @@ def upload_file_to_shopify_tool(file_path: str, alt: str = None) -> str:
         str: The JSON response from Shopify as a string.
     """
     try:
-        result = upload_file_to_shopify(file_path, alt)
-        return json.dumps(result)   
+        result = await upload_file_to_shopify(file_path, alt)
+        return orjson.dumps(result).decode()
     except Exception as e:
         return f"Error uploading file: {str(e)}"
 
+@mcp.tool()
+async def upload_files_to_shopify_tool(file_paths: List[str], alts: Optional[List[Optional[str]]] = None) -> str:
+    """
+    MCP tool: Upload several files to the Shopify store's Files section in one batch.
+    Args:
+        file_paths (List[str]): Local paths to the files.
+        alts (List[Optional[str]], optional): Alt text per file, in the same order.
+    Returns:
+        str: The JSON response from Shopify as a string.
+    """
+    try:
+        result = await upload_files_to_shopify(file_paths, alts)
+        return orjson.dumps(result).decode()
+    except Exception as e:
+        return f"Error uploading files: {str(e)}"
+
 if __name__ == "__main__":
+    _load_credentials()
     mcp.run(transport='stdio')
\ No newline at end of file